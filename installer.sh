@@ -87,7 +87,7 @@ echo ""
 
 # 5. Install Python libraries
 echo "Step 5/5: Installing Python libraries..."
-print_info "Installing: requests, beautifulsoup4, Pillow..."
+print_info "Installing: requests, beautifulsoup4, Pillow, numpy..."
 
 # Check if pip3 is available
 if ! command -v pip3 &> /dev/null; then
@@ -96,7 +96,7 @@ if ! command -v pip3 &> /dev/null; then
 fi
 
 pip3 install --upgrade pip --quiet
-pip3 install requests beautifulsoup4 Pillow --quiet
+pip3 install requests beautifulsoup4 Pillow numpy --quiet
 
 print_success "Python libraries installed!"
 echo ""
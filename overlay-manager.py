@@ -8,14 +8,65 @@ import os
 import sys
 import argparse
 import hashlib
+import io
+import json
+import queue
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
+import numpy as np
 from PIL import Image
 
+# Memories are the user's own photos - skip Pillow's decompression bomb check
+Image.MAX_IMAGE_PIXELS = None
+
+# Optional: Numba compiles a faster alpha-blend kernel (pip install numba)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Optional: libvips streams images through a low-memory pipeline (pip install pyvips)
+# Used when numba is not installed - it is about as fast as the Numba kernel and
+# clearly faster than plain NumPy. Images already get one worker thread per core,
+# so libvips is kept single-threaded to avoid oversubscribing the CPU
+os.environ.setdefault('VIPS_CONCURRENCY', '1')
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
 # Configuration
 SOURCE_FOLDER = 'snapchat_memories'
 OUTPUT_FOLDER = 'snapchat_memories_combined'
+SETTINGS_FILE = '.combine_settings.json'  # Encode settings and inputs of each combined file, kept in the output folder
 DEFAULT_JPEG_QUALITY = 100  # Maximum quality - adjust lower (e.g., 85-95) to save disk space
+FAST_DECODE_MAX_QUALITY = 85  # --fast-decode only kicks in below this JPEG quality
+FAST_DECODE_MIN_PIXELS = 1_000_000  # ...and only for images at least this large
+DEFAULT_VIDEO_PARALLEL = 2  # Parallel ffmpeg jobs - x264 threading flattens out, so two jobs fill idle cores
+SCAN_WORKERS = 16  # Parallel directory listings while scanning for overlays
+HWACCEL_CHOICES = ['auto', 'cuda', 'vaapi', 'videotoolbox', 'none']
+VAAPI_DEVICE = '/dev/dri/renderD128'  # Default render node on Linux (Intel/AMD)
+HW_VIDEO_BITRATE = '8M'  # Target bitrate for hardware encoders
+# x264 preset for software encoding - the overlay covers a small part of the frame,
+# so faster presets cost very little visible quality
+VIDEO_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
+DEFAULT_VIDEO_PRESET = 'veryfast'
+
+# Overlays that did not match their base image size (shared by image workers)
+resize_lock = threading.Lock()
+resized_overlays = 0
+
+# GPU encoder sessions are limited, so hardware encodes run one at a time
+# (clips that fall back to software still use all video workers)
+gpu_session = threading.Lock()
+
+# Blend output/scratch arrays, one set per image worker thread (see _thread_buffer)
+blend_buffers = threading.local()
 
 # ==============================================================================
 # DEDUPLICATION FUNCTIONS (from delete-dupes.py)
@@ -205,252 +256,712 @@ def process_deduplication(directory, dry_run=True):
 # OVERLAY COMBINING FUNCTIONS (from combine-overlays.py)
 # ==============================================================================
 
+@lru_cache(maxsize=1)
 def check_ffmpeg_available():
-    """Check if ffmpeg is installed and available"""
+    """Check if ffmpeg is installed and available (probed once per run)"""
     try:
         subprocess.run(['ffmpeg', '-version'], 
+                      stdin=subprocess.DEVNULL,
                       capture_output=True, 
                       check=True)
         return True
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
-def find_overlay_folders(directory):
+def _hwaccel_candidates():
+    """List the hardware backends this ffmpeg was built with, in order of preference"""
+    try:
+        hwaccels = subprocess.run(['ffmpeg', '-hide_banner', '-hwaccels'], stdin=subprocess.DEVNULL,
+                                  capture_output=True, text=True, check=True).stdout.split()
+        encoders = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], stdin=subprocess.DEVNULL,
+                                  capture_output=True, text=True, check=True).stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return []
+    
+    candidates = []
+    if 'cuda' in hwaccels and 'h264_nvenc' in encoders:
+        candidates.append('cuda')
+    if 'vaapi' in hwaccels and 'h264_vaapi' in encoders and os.path.exists(VAAPI_DEVICE):
+        candidates.append('vaapi')
+    if 'videotoolbox' in hwaccels and 'h264_videotoolbox' in encoders:
+        candidates.append('videotoolbox')
+    return candidates
+
+@lru_cache(maxsize=None)
+def hwaccel_works(hwaccel):
+    """
+    Run the real combine command for a hardware backend on a tiny generated clip (probed once per run)
+    ffmpeg lists cuda/vaapi/videotoolbox whenever it was built with them, but a device may be
+    missing and builds often lack the GPU overlay filters - only the full command tells
+    """
+    with tempfile.TemporaryDirectory() as probe_dir:
+        base_path = os.path.join(probe_dir, 'probe.mp4')
+        overlay_path = os.path.join(probe_dir, 'probe.png')
+        output_path = os.path.join(probe_dir, 'probe_combined.mp4')
+        
+        Image.new('RGBA', (256, 256), (255, 255, 255, 128)).save(overlay_path)
+        make_clip = ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error',
+                     '-f', 'lavfi', '-i', 'testsrc2=s=256x256:r=30', '-frames:v', '2',
+                     '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-y', base_path]
+        try:
+            subprocess.run(make_clip, stdin=subprocess.DEVNULL, capture_output=True, check=True, timeout=30)
+            subprocess.run(build_video_command(base_path, overlay_path, output_path, hwaccel),
+                           stdin=subprocess.DEVNULL, capture_output=True, check=True, timeout=60)
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+            return False
+
+@lru_cache(maxsize=1)
+def detect_hwaccel():
+    """
+    Pick the first hardware backend whose full combine command works (probed once per run)
+    Returns 'cuda', 'vaapi', 'videotoolbox' or 'none'
+    """
+    for hwaccel in _hwaccel_candidates():
+        if hwaccel_works(hwaccel):
+            return hwaccel
+    return 'none'
+
+def get_original_timestamps(path):
+    """
+    Get the (atime, mtime) pair to copy onto a combined file
+    Uses birth time (created date) which is not affected by metadata writes
+    """
+    stat_info = os.stat(path)
+    # Use birth time (st_birthtime) instead of modification time
+    # Birth time is the creation date and doesn't change when metadata is written
+    original_mtime = stat_info.st_birthtime if hasattr(stat_info, 'st_birthtime') else stat_info.st_mtime
+    return stat_info.st_atime, original_mtime
+
+def image_settings(base_path, quality, fast_decode):
+    """
+    Settings that change the content of a combined image
+    Recorded per output so that a rerun with different settings rewrites it
+    fast_decode only counts when it actually shrinks this image (large JPEGs, low quality)
+    """
+    shrunk = False
+    if fast_decode and quality < FAST_DECODE_MAX_QUALITY:
+        # Opening only reads the header
+        with Image.open(base_path) as base_img:
+            shrunk = base_img.format == 'JPEG' and use_fast_decode(base_img.width, base_img.height, quality, fast_decode)
+    return {'quality': quality, 'fast_decode': shrunk}
+
+def video_settings(hwaccel, video_preset, requested_hwaccel=None):
+    """
+    Settings that change the content of a combined video, for the encoder that was actually used
+    The x264 preset only applies to software encodes. Clips that fell back to software
+    remember the hardware mode that failed, so later runs with that mode keep them
+    """
+    settings = {'hwaccel': hwaccel}
+    if hwaccel == 'none':
+        settings['video_preset'] = video_preset
+    if requested_hwaccel not in (None, hwaccel):
+        settings['fallback_from'] = requested_hwaccel
+    return settings
+
+def input_signature(*paths):
+    """
+    Size, mtime and file ID of each input file
+    Recorded with the encode settings, so a replaced or edited input is noticed on every platform
+    """
+    signature = []
+    for path in paths:
+        stat_info = os.stat(path)
+        signature.append([stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino])
+    return signature
+
+def load_encode_settings(output_dir):
+    """Load what previous runs recorded (output filename -> {'settings': ..., 'inputs': ...})"""
+    try:
+        with open(os.path.join(output_dir, SETTINGS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_encode_settings(output_dir, settings):
+    """Save the recorded encode settings (via a temp file, so an interrupted save keeps the old one)"""
+    settings_path = os.path.join(output_dir, SETTINGS_FILE)
+    try:
+        with open(settings_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(settings, f, indent=2, ensure_ascii=False)
+        os.replace(settings_path + '.tmp', settings_path)
+    except Exception as e:
+        print(f"❌ Error saving encode settings: {e}")
+
+def is_output_up_to_date(output_path, base_path, overlay_path, accepted_settings, inputs, recorded):
+    """
+    Check whether a combined file from a previous run can be kept
+    - its recorded encode settings must be one of accepted_settings (quality, fast decode, encoder, preset)
+    - the inputs must still match the recorded input_signature()
+    Combined files carry the overlay's timestamps, so their mtime can't say when they were written:
+    - mtime must still be the overlay's timestamp (otherwise the run was interrupted mid-write)
+    - on POSIX, ctime (set when the file was written) must be newer than both inputs' ctime,
+      which also catches same-size metadata.py edits that restore the inputs' mtime afterwards
+      (on Windows ctime is the creation time, so only the recorded signature is checked there)
+    """
+    if not recorded or recorded.get('settings') not in accepted_settings or recorded.get('inputs') != inputs:
+        return False
+    
+    try:
+        output_stat = os.stat(output_path)
+    except FileNotFoundError:
+        return False
+    
+    _, expected_mtime = get_original_timestamps(overlay_path)
+    if abs(output_stat.st_mtime - expected_mtime) > 1:
+        return False
+    
+    if os.name == 'nt':
+        return True
+    return output_stat.st_ctime >= max(os.stat(base_path).st_ctime, os.stat(overlay_path).st_ctime)
+
+def _scandir(path):
+    """List a directory with os.scandir, closing the handle before returning"""
+    with os.scandir(path) as entries:
+        return list(entries)
+
+def _scan_folder(entry):
     """
-    Scan directory and find all folders containing overlay files
-    Returns list of dicts with folder info and file paths
+    Classify the files of a single memory folder
+    Returns folder info dict if the folder contains an overlay, otherwise None
     """
-    overlay_folders = []
+    # Find overlay and main files in a single pass (lowercase each name once)
+    overlay_files = []
+    main_images = []
+    main_videos = []
+    for f in _scandir(entry.path):
+        name = f.name.lower()
+        if name.endswith('-overlay.png'):
+            overlay_files.append(f.path)
+        elif name.endswith('-main.jpg'):
+            main_images.append(f.path)
+        elif name.endswith('-main.mp4'):
+            main_videos.append(f.path)
     
+    if not overlay_files:
+        return None
+    
+    return {
+        'folder_name': entry.name,
+        'folder_path': entry.path,
+        'overlays': overlay_files,
+        'base_image': main_images[0] if main_images else None,
+        'base_video': main_videos[0] if main_videos else None,
+        'is_image': bool(main_images),
+        'is_video': bool(main_videos)
+    }
+
+def iter_overlay_folders(directory):
+    """
+    Scan directory and yield info for every folder containing overlay files
+    Folders are yielded as soon as they are scanned, so combining can start right away
+    """
     if not os.path.exists(directory):
         print(f"❌ Folder '{directory}' does not exist!")
-        return overlay_folders
+        return
     
     print("🔍 Scanning for memories with overlays...")
     
-    for item in os.listdir(directory):
-        item_path = os.path.join(directory, item)
-        
-        # Only process directories
-        if not os.path.isdir(item_path):
-            continue
-        
-        # Look for overlay files in this folder
-        files = os.listdir(item_path)
-        
-        # Find overlay and main files
-        overlay_files = [f for f in files if '-overlay.png' in f.lower()]
-        main_images = [f for f in files if '-main.jpg' in f.lower()]
-        main_videos = [f for f in files if '-main.mp4' in f.lower()]
-        
-        if overlay_files:
-            folder_info = {
-                'folder_name': item,
-                'folder_path': item_path,
-                'overlays': [os.path.join(item_path, f) for f in overlay_files],
-                'base_image': os.path.join(item_path, main_images[0]) if main_images else None,
-                'base_video': os.path.join(item_path, main_videos[0]) if main_videos else None,
-                'is_image': bool(main_images),
-                'is_video': bool(main_videos)
-            }
-            overlay_folders.append(folder_info)
-    
-    return overlay_folders
-
-def combine_image(base_path, overlay_path, output_path, quality=DEFAULT_JPEG_QUALITY):
+    # Only process directories (DirEntry caches the file type, no extra stat)
+    folders = [entry for entry in _scandir(directory) if entry.is_dir()]
+    
+    # On a cold cache each folder listing waits on disk; os.scandir releases the GIL,
+    # so a few threads keep several directory reads in flight at once
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as scan_pool:
+        for folder_info in scan_pool.map(_scan_folder, folders):
+            if folder_info:
+                yield folder_info
+
+def _create_output_dir_first(overlay_folders, output_dir):
+    """
+    Pass scanned folders through, creating the output directory just before the first one
+    (a missing or empty source folder then doesn't leave an empty output folder behind)
+    """
+    for found, folder_info in enumerate(overlay_folders):
+        if found == 0:
+            os.makedirs(output_dir, exist_ok=True)
+        yield folder_info
+
+if njit is not None:
+    @njit(nogil=True, cache=True)
+    def _blend_kernel(base_arr, overlay_arr, out):
+        """
+        Compiled per-pixel version of the blend in blend_overlay()
+        Releases the GIL so the image thread pool runs several blends at once
+        """
+        height, width = out.shape[0], out.shape[1]
+        for y in range(height):
+            for x in range(width):
+                alpha = np.int32(overlay_arr[y, x, 3])
+                inverse = 255 - alpha
+                for c in range(3):
+                    value = np.int32(overlay_arr[y, x, c]) * alpha + np.int32(base_arr[y, x, c]) * inverse + 128
+                    out[y, x, c] = (value + (value >> 8)) >> 8
+else:
+    _blend_kernel = None
+
+def _thread_buffer(name, shape, dtype):
+    """
+    Get a scratch array owned by the current worker thread
+    Reallocated only when the image size changes, so same-sized memories reuse it
+    """
+    buffer = getattr(blend_buffers, name, None)
+    if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+        buffer = np.empty(shape, dtype=dtype)
+        setattr(blend_buffers, name, buffer)
+    return buffer
+
+def blend_overlay(base_arr, overlay_arr):
+    """
+    Alpha-blend an RGBA overlay array onto an RGB base array (both uint8, same HxW)
+    Computes (F * a + B * (255 - a)) / 255 with the same rounding as Pillow's paste()
+    Uses the compiled Numba kernel when available, otherwise vectorized NumPy
+    The returned array is a per-thread buffer that the next call on this thread overwrites
+    """
+    height, width = base_arr.shape[:2]
+    out = _thread_buffer('out', (height, width, 3), np.uint8)
+    
+    if _blend_kernel is not None:
+        _blend_kernel(base_arr, overlay_arr, out)
+        return out
+    
+    # NumPy fallback in uint16, entirely in per-thread scratch buffers
+    alpha = _thread_buffer('alpha', (height, width, 1), np.uint16)
+    blended = _thread_buffer('blended', (height, width, 3), np.uint16)
+    scratch = _thread_buffer('scratch', (height, width, 3), np.uint16)
+    np.copyto(alpha, overlay_arr[..., 3:4])
+    np.copyto(blended, overlay_arr[..., :3])
+    np.copyto(scratch, base_arr)
+    
+    # blended = F * a + B * (255 - a) + 128
+    np.multiply(blended, alpha, out=blended)
+    np.subtract(255, alpha, out=alpha)
+    np.multiply(scratch, alpha, out=scratch)
+    np.add(blended, scratch, out=blended)
+    np.add(blended, 128, out=blended)
+    
+    # Exact rounded division by 255: (x + (x >> 8)) >> 8
+    np.right_shift(blended, 8, out=scratch)
+    np.add(blended, scratch, out=blended)
+    np.right_shift(blended, 8, out=blended)
+    
+    np.copyto(out, blended, casting='unsafe')
+    return out
+
+def count_resized_overlay():
+    """Record an overlay that had to be resized to its base image (thread-safe)"""
+    global resized_overlays
+    with resize_lock:
+        resized_overlays += 1
+
+def use_fast_decode(width, height, quality, fast_decode):
+    """Check whether a base image should be decoded at half resolution"""
+    return fast_decode and quality < FAST_DECODE_MAX_QUALITY and width * height >= FAST_DECODE_MIN_PIXELS
+
+def _composite_image_vips(base_path, overlay_path, quality, fast_decode=False):
+    """
+    Composite with libvips, which decodes, blends and encodes in small strips
+    Returns the encoded JPEG bytes (EXIF metadata of the base image is carried over)
+    """
+    base = pyvips.Image.new_from_file(base_path, access='sequential')
+    shrunk = False
+    if use_fast_decode(base.width, base.height, quality, fast_decode) and base.get('vips-loader').startswith('jpegload'):
+        # libjpeg scales down 2x in the DCT domain, which is nearly free
+        base = pyvips.Image.new_from_file(base_path, access='sequential', shrink=2)
+        shrunk = True
+    overlay = pyvips.Image.new_from_file(overlay_path, access='sequential')
+    
+    # Normalize grayscale/CMYK bases and non-RGBA overlays
+    if base.interpretation != 'srgb':
+        base = base.colourspace('srgb')
+    if overlay.interpretation != 'srgb':
+        overlay = overlay.colourspace('srgb')
+    if not overlay.hasalpha():
+        overlay = overlay.bandjoin(255)
+    
+    # Snapchat overlays are rendered on the base image's pixel grid, so a
+    # resize should be rare - use cheap bilinear and count it for the summary
+    if (overlay.width, overlay.height) != (base.width, base.height):
+        overlay = overlay.resize(base.width / overlay.width, vscale=base.height / overlay.height, kernel='linear')
+        if not shrunk:
+            count_resized_overlay()
+    
+    # Composite: blend overlay on top of base, then drop the (fully opaque) alpha band
+    combined = base.composite2(overlay, 'over').extract_band(0, n=3)
+    
+    # Always use 4:2:0 chroma like Pillow (libvips turns subsampling off at Q >= 90)
+    return combined.jpegsave_buffer(Q=quality, subsample_mode='on')
+
+def _composite_image_pillow(base_path, overlay_path, quality, fast_decode=False):
+    """
+    Composite with Pillow and the NumPy/Numba blend kernel
+    Returns the encoded JPEG bytes (EXIF metadata of the base image is carried over)
+    """
+    # Load base image and overlay
+    base_img = Image.open(base_path)
+    
+    # Try to preserve EXIF data using Pillow's built-in methods (grab it before decoding)
+    exif_data = None
+    try:
+        exif_data = base_img.info.get('exif')
+    except Exception:
+        pass
+    
+    # With fast decode, let libjpeg scale down 2x in the DCT domain, which is nearly free
+    # (no-op for non-JPEG files)
+    width, height = base_img.size
+    if use_fast_decode(width, height, quality, fast_decode):
+        base_img.draft('RGB', (width // 2, height // 2))
+    shrunk = base_img.size != (width, height)
+    # Pillow already has libjpeg output RGB for ordinary YCbCr JPEGs - only convert other modes
+    base = base_img if base_img.mode == 'RGB' else base_img.convert('RGB')
+    overlay = Image.open(overlay_path)
+    if overlay.mode != 'RGBA':
+        overlay = overlay.convert('RGBA')
+    
+    # Snapchat overlays are rendered on the base image's pixel grid, so a
+    # resize should be rare - use cheap bilinear and count it for the summary
+    if overlay.size != base.size:
+        overlay = overlay.resize(base.size, Image.Resampling.BILINEAR)
+        if not shrunk:
+            count_resized_overlay()
+    
+    # Composite: blend overlay on top of base using its alpha channel
+    # (drop the decoded images as soon as their pixels are copied into arrays)
+    base_arr = np.asarray(base, dtype=np.uint8)
+    overlay_arr = np.asarray(overlay, dtype=np.uint8)
+    del base, base_img, overlay
+    base = Image.fromarray(blend_overlay(base_arr, overlay_arr))
+    del base_arr, overlay_arr
+    
+    # Encode combined image in memory (libjpeg otherwise issues many small writes to the file)
+    buffer = io.BytesIO()
+    if exif_data:
+        base.save(buffer, 'JPEG', quality=quality, exif=exif_data)
+    else:
+        base.save(buffer, 'JPEG', quality=quality)
+    return buffer.getbuffer()
+
+def combine_image(base_path, overlay_path, output_path, quality=DEFAULT_JPEG_QUALITY, fast_decode=False):
     """
     Composite overlay PNG onto base JPG image
+    Uses Pillow with the Numba kernel when numba is installed, otherwise pyvips
+    when installed, otherwise Pillow with NumPy
+    With fast_decode, large images are decoded and saved at half resolution when quality is low
     Preserves EXIF metadata and file timestamps from overlay (which has correct date)
     Uses birth time (created date) which is not affected by metadata writes
+    Returns None on success, otherwise an error message (printed by the caller)
     """
     try:
         # Get original file timestamps from overlay (overlay has correct date)
-        stat_info = os.stat(overlay_path)
-        original_atime = stat_info.st_atime  # Access time
-        # Use birth time (st_birthtime) instead of modification time
-        # Birth time is the creation date and doesn't change when metadata is written
-        original_mtime = stat_info.st_birthtime if hasattr(stat_info, 'st_birthtime') else stat_info.st_mtime
-        
-        # Load base image and overlay
-        base_img = Image.open(base_path)
-        base = base_img.convert('RGB')
-        overlay = Image.open(overlay_path).convert('RGBA')
-        
-        # Resize overlay to match base image dimensions if needed
-        if overlay.size != base.size:
-            overlay = overlay.resize(base.size, Image.Resampling.LANCZOS)
-        
-        # Composite: paste overlay on top of base using alpha channel
-        base.paste(overlay, (0, 0), overlay)
-        
-        # Try to preserve EXIF data using Pillow's built-in methods
-        exif_data = None
-        try:
-            exif_data = base_img.info.get('exif')
-        except Exception:
-            pass
+        original_atime, original_mtime = get_original_timestamps(overlay_path)
         
-        # Save combined image
-        if exif_data:
-            base.save(output_path, 'JPEG', quality=quality, exif=exif_data)
+        if pyvips is not None and njit is None:
+            jpeg_data = _composite_image_vips(base_path, overlay_path, quality, fast_decode)
         else:
-            base.save(output_path, 'JPEG', quality=quality)
+            jpeg_data = _composite_image_pillow(base_path, overlay_path, quality, fast_decode)
+        
+        # Write the encoded image with a single call
+        with open(output_path, 'wb') as f:
+            f.write(jpeg_data)
         
         # Restore original file timestamps
         os.utime(output_path, (original_atime, original_mtime))
         
-        return True
+        return None
     except Exception as e:
-        print(f"      ❌ Error combining image: {e}")
-        return False
+        return f"Error combining image: {str(e).strip()}"
 
-def combine_video(base_path, overlay_path, output_path):
+def build_video_command(base_path, overlay_path, output_path, hwaccel='none', preset=DEFAULT_VIDEO_PRESET):
+    """
+    Build the ffmpeg command that burns the overlay onto the video
+    Hardware modes decode and encode on the GPU. CUDA and VAAPI also composite there, so
+    decoded frames stay in GPU memory and only the overlay PNG is uploaded once
+    (VideoToolbox has no overlay filter, so it composites on the CPU)
+    hwaccel_works() runs this command on a test clip before a hardware mode is used
+    Software mode uses libx264 on all cores with the given preset
+    """
+    if hwaccel == 'cuda':
+        input_args = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+        # NVDEC outputs NV12, but overlay_cuda only puts a yuva420p overlay on a yuv420p main
+        filter_graph = ('[0:v]scale_cuda=format=yuv420p[main];'
+                        '[1:v]format=yuva420p,hwupload_cuda[ov];[main][ov]overlay_cuda=0:0')
+        encode_args = ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', '23', '-b:v', '0']
+    elif hwaccel == 'vaapi':
+        input_args = ['-hwaccel', 'vaapi', '-hwaccel_output_format', 'vaapi', '-vaapi_device', VAAPI_DEVICE]
+        filter_graph = '[1:v]format=rgba,hwupload[ov];[0:v][ov]overlay_vaapi=x=0:y=0'
+        encode_args = ['-c:v', 'h264_vaapi', '-b:v', HW_VIDEO_BITRATE]
+    elif hwaccel == 'videotoolbox':
+        input_args = ['-hwaccel', 'videotoolbox']
+        filter_graph = '[0:v][1:v]overlay=0:0'
+        encode_args = ['-c:v', 'h264_videotoolbox', '-b:v', HW_VIDEO_BITRATE]
+    else:
+        input_args = []
+        filter_graph = '[0:v][1:v]overlay=0:0'  # Overlay at position 0,0
+        encode_args = ['-threads', '0', '-preset', preset, '-tune', 'fastdecode']
+    
+    return [
+        'ffmpeg',
+        '-hide_banner',                # Skip the version/build banner
+        '-nostdin',                    # Never wait on the terminal (jobs run in parallel)
+        '-nostats',                    # No per-frame progress output
+        '-loglevel', 'error',          # Only write to stderr when something fails
+        *input_args,
+        '-i', base_path,               # Input video
+        '-i', overlay_path,            # Input overlay
+        '-filter_complex', filter_graph,
+        *encode_args,
+        '-c:a', 'copy',                # Copy audio without re-encoding
+        '-movflags', '+faststart',     # Put the index first so players can start instantly
+        '-y',                          # Overwrite output file
+        output_path
+    ]
+
+def combine_video(base_path, overlay_path, output_path, hwaccel='none', preset=DEFAULT_VIDEO_PRESET):
     """
     Burn overlay PNG onto video using ffmpeg
     Preserves video codec, audio, metadata, and file timestamps from overlay (which has correct date)
     Uses birth time (created date) which is not affected by metadata writes
+    The backend was checked up front, so a hardware failure is specific to this clip
+    (e.g. 10-bit HEVC the GPU decoder can't handle) - only this clip is redone in software
+    Returns (error, hwaccel used) - error is None on success, otherwise a message printed by the caller
     """
     try:
         # Get original file timestamps from overlay (overlay has correct date)
-        stat_info = os.stat(overlay_path)
-        original_atime = stat_info.st_atime  # Access time
-        # Use birth time (st_birthtime) instead of modification time
-        # Birth time is the creation date and doesn't change when metadata is written
-        original_mtime = stat_info.st_birthtime if hasattr(stat_info, 'st_birthtime') else stat_info.st_mtime
+        original_atime, original_mtime = get_original_timestamps(overlay_path)
         
-        # ffmpeg command to overlay PNG on video
-        # Using overlay filter to composite the PNG on top
-        cmd = [
-            'ffmpeg',
-            '-i', base_path,           # Input video
-            '-i', overlay_path,        # Input overlay
-            '-filter_complex', '[0:v][1:v]overlay=0:0',  # Overlay at position 0,0
-            '-c:a', 'copy',            # Copy audio without re-encoding
-            '-y',                      # Overwrite output file
-            output_path
-        ]
+        if hwaccel != 'none':
+            cmd = build_video_command(base_path, overlay_path, output_path, hwaccel, preset)
+            try:
+                with gpu_session:
+                    subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+            except subprocess.CalledProcessError:
+                hwaccel = 'none'
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        if hwaccel == 'none':
+            cmd = build_video_command(base_path, overlay_path, output_path, preset=preset)
+            subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
         
         # Restore original file timestamps
         os.utime(output_path, (original_atime, original_mtime))
         
-        return True
+        return None, hwaccel
     except subprocess.CalledProcessError as e:
-        print(f"      ❌ ffmpeg error: {e.stderr}")
-        return False
+        return f"ffmpeg error: {e.stderr.decode('utf-8', 'replace').strip()}", hwaccel
     except Exception as e:
-        print(f"      ❌ Error combining video: {e}")
-        return False
+        return f"Error combining video: {e}", hwaccel
 
-def process_overlay_combining(source_dir, output_dir, dry_run=True, quality=DEFAULT_JPEG_QUALITY, has_ffmpeg=False):
+def _process_folder(folder_info, output_dir, dry_run, quality, has_ffmpeg, hwaccel='none',
+                    video_preset=DEFAULT_VIDEO_PRESET, force=False, fast_decode=False, recorded_settings=None):
     """
-    Main processing function for combining overlays
-    Finds all overlay folders and combines them
+    Combine a single overlay folder (runs inside a worker)
+    Returns a small dict describing the outcome for the summary
     """
-    # Find all folders with overlays
-    overlay_folders = find_overlay_folders(source_dir)
+    folder_name = folder_info['folder_name']
+    result = {
+        'folder': folder_name,
+        'kind': None,
+        'output': None,
+        'success': False,
+        'skipped': False,
+        'up_to_date': False,
+        'error': None,
+        'settings': None,
+        'inputs': None,
+        'hwaccel': None
+    }
     
-    if not overlay_folders:
-        print("✅ No memories with overlays found!")
-        return
+    # Determine output filename
+    # Remove trailing slash and use folder name as base
+    output_filename = f"{folder_name}_combined"
     
-    # Count what we found
-    image_count = sum(1 for f in overlay_folders if f['is_image'])
-    video_count = sum(1 for f in overlay_folders if f['is_video'])
+    if folder_info['is_image']:
+        result['kind'] = 'image'
+        result['output'] = output_filename + '.jpg'
+        base_path = folder_info['base_image']
+    elif folder_info['is_video']:
+        result['kind'] = 'video'
+        result['output'] = output_filename + '.mp4'
+        base_path = folder_info['base_video']
+        if not has_ffmpeg:
+            result['skipped'] = True
+            return result
+    else:
+        return result
     
-    print(f"\n📊 Found {len(overlay_folders)} memories with overlays:")
-    print(f"   📷 Images: {image_count}")
-    print(f"   🎥 Videos: {video_count}")
+    overlay_path = folder_info['overlays'][0]  # Use first overlay
+    output_path = os.path.join(output_dir, result['output'])
+    try:
+        if result['kind'] == 'image':
+            result['settings'] = image_settings(base_path, quality, fast_decode)
+            accepted_settings = [result['settings']]
+        else:
+            accepted_settings = [video_settings(hwaccel, video_preset)]
+            if hwaccel != 'none':
+                # Clips that already fell back from this mode would fail on it again
+                accepted_settings.append(video_settings('none', video_preset, hwaccel))
+            else:
+                # A software fallback is a plain software encode
+                accepted_settings += [video_settings('none', video_preset, mode)
+                                      for mode in HWACCEL_CHOICES if mode not in ('auto', 'none')]
+        result['inputs'] = input_signature(base_path, overlay_path)
+    except Exception as e:
+        result['error'] = f"Error reading {os.path.basename(base_path)}: {e}"
+        return result
     
-    if video_count > 0 and not has_ffmpeg:
-        print("\n⚠️  WARNING: ffmpeg not found!")
-        print("   Videos with overlays will be skipped.")
-        print("   Install ffmpeg to process videos: brew install ffmpeg (macOS)")
+    if not force and is_output_up_to_date(output_path, base_path, overlay_path, accepted_settings,
+                                          result['inputs'], (recorded_settings or {}).get(result['output'])):
+        result['up_to_date'] = True
+    elif dry_run:
+        result['success'] = True
+    else:
+        if result['kind'] == 'image':
+            result['error'] = combine_image(base_path, overlay_path, output_path, quality, fast_decode)
+        else:
+            result['error'], result['hwaccel'] = combine_video(base_path, overlay_path, output_path, hwaccel, video_preset)
+            result['settings'] = video_settings(result['hwaccel'], video_preset, hwaccel)
+        result['success'] = result['error'] is None
     
-    print("\n" + "=" * 80)
-    print()
+    return result
+
+def _stream_results(overlay_folders, image_pool, video_pool, worker):
+    """
+    Hand folders to the worker pools as they are scanned and yield results as they finish
+    Images go to the image thread pool, everything else to the video pool
+    """
+    finished = queue.Queue()
+    pending = 0
     
-    # Create output directory if not dry run
-    if not dry_run:
-        os.makedirs(output_dir, exist_ok=True)
+    for folder_info in overlay_folders:
+        if folder_info['is_image']:
+            image_pool.apply_async(worker, (folder_info,), callback=finished.put, error_callback=finished.put)
+        else:
+            future = video_pool.submit(worker, folder_info)
+            future.add_done_callback(lambda f: finished.put(f.exception() or f.result()))
+        pending += 1
+        
+        # Report whatever already finished while the scan keeps going
+        while not finished.empty():
+            pending -= 1
+            yield _unwrap_result(finished.get())
     
+    while pending:
+        pending -= 1
+        yield _unwrap_result(finished.get())
+
+def _unwrap_result(result):
+    """Re-raise an exception that escaped a worker, otherwise return its result"""
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+def process_overlay_combining(source_dir, output_dir, dry_run=True, quality=DEFAULT_JPEG_QUALITY, has_ffmpeg=False,
+                              hwaccel='none', video_preset=DEFAULT_VIDEO_PRESET, video_parallel=DEFAULT_VIDEO_PARALLEL,
+                              force=False, fast_decode=False):
+    """
+    Main processing function for combining overlays
+    Combines overlay folders in parallel while the scan is still finding them
+    Images are spread over a thread pool, videos over a small separate pool
+    (each ffmpeg process is already multi-threaded)
+    Hardware-accelerated videos run one at a time since GPU encoder sessions are limited
+    (see gpu_session), software fallbacks still use all video workers
+    Outputs that are already up to date are skipped unless force is set
+    The encode settings of every written file are saved to SETTINGS_FILE
+    """
     # Process each folder
+    found = 0
+    image_count = 0
+    video_count = 0
     processed_images = 0
     processed_videos = 0
     skipped_videos = 0
+    up_to_date = 0
     errors = 0
+    software_fallbacks = 0
     error_details = []  # Track error details
     
-    total_folders = len(overlay_folders)
+    # Workers check against the settings loaded here, new files are recorded separately
+    recorded_settings = load_encode_settings(output_dir)
+    written_settings = {}
     
-    for idx, folder_info in enumerate(overlay_folders, 1):
-        folder_name = folder_info['folder_name']
-        print(f"[{idx}/{total_folders}] 📁 {folder_name}")
-        
-        # Determine output filename
-        # Remove trailing slash and use folder name as base
-        output_filename = f"{folder_name}_combined"
+    image_workers = os.cpu_count() or 1
+    worker = partial(
+        _process_folder,
+        output_dir=output_dir,
+        dry_run=dry_run,
+        quality=quality,
+        has_ffmpeg=has_ffmpeg,
+        hwaccel=hwaccel,
+        video_preset=video_preset,
+        force=force,
+        fast_decode=fast_decode,
+        recorded_settings=recorded_settings
+    )
+    
+    # Pillow releases the GIL while decoding, compositing and encoding,
+    # so plain threads overlap the image work without any pickling overhead
+    with ThreadPool(image_workers) as image_pool, \
+         ThreadPoolExecutor(max_workers=video_parallel) as video_pool:
+        # Create output directory once the scan finds something (if not dry run)
+        overlay_folders = iter_overlay_folders(source_dir)
+        if not dry_run:
+            overlay_folders = _create_output_dir_first(overlay_folders, output_dir)
+        results = _stream_results(overlay_folders, image_pool, video_pool, worker)
         
-        if folder_info['is_image']:
-            output_filename += '.jpg'
-            output_path = os.path.join(output_dir, output_filename)
+        try:
+            for found, result in enumerate(results, 1):
+                if found == 1:
+                    print(f"🔄 Processing folders as they are found ({image_workers} image workers, {video_parallel} video workers)...")
+                    print()
+                
+                if result['kind'] == 'image':
+                    image_count += 1
+                elif result['kind'] == 'video':
+                    video_count += 1
             
-            if dry_run:
-                print(f"                Would create: {output_filename}")
-            else:
-                print(f"                Creating: {output_filename}")
-                success = combine_image(
-                    folder_info['base_image'],
-                    folder_info['overlays'][0],  # Use first overlay
-                    output_path,
-                    quality
-                )
-                if success:
-                    processed_images += 1
-                    print(f"                ✅ Saved!")
+                print(f"[{found}] 📁 {result['folder']}")
+            
+                if result['skipped']:
+                    print(f"                ⏭️  Skipping video (ffmpeg not available)")
+                    skipped_videos += 1
+                elif result['kind'] is None:
+                    pass
+                elif result['up_to_date']:
+                    print(f"                ⏭️  Up to date: {result['output']}")
+                    up_to_date += 1
+                elif result['success']:
+                    if result['kind'] == 'image':
+                        processed_images += 1
+                    else:
+                        processed_videos += 1
+                    if dry_run:
+                        print(f"                Would create: {result['output']}")
+                    else:
+                        print(f"                ✅ Saved: {result['output']}")
+                        written_settings[result['output']] = {'settings': result['settings'], 'inputs': result['inputs']}
+                    if result['kind'] == 'video' and result['hwaccel'] != hwaccel:
+                        software_fallbacks += 1
                 else:
                     errors += 1
+                    print(f"                ❌ Failed: {result['output']}")
+                    print(f"                   {result['error']}")
                     error_details.append({
-                        'folder': folder_name,
-                        'type': 'image',
-                        'output': output_filename
+                        'folder': result['folder'],
+                        'type': result['kind'],
+                        'output': result['output'],
+                        'error': result['error']
                     })
-        
-        elif folder_info['is_video']:
-            if not has_ffmpeg:
-                print(f"                ⏭️  Skipping video (ffmpeg not available)")
-                skipped_videos += 1
-            else:
-                output_filename += '.mp4'
-                output_path = os.path.join(output_dir, output_filename)
-                
-                if dry_run:
-                    print(f"                Would create: {output_filename}")
-                else:
-                    print(f"                Creating: {output_filename}")
-                    success = combine_video(
-                        folder_info['base_video'],
-                        folder_info['overlays'][0],  # Use first overlay
-                        output_path
-                    )
-                    if success:
-                        processed_videos += 1
-                        print(f"                ✅ Saved!")
-                    else:
-                        errors += 1
-                        error_details.append({
-                            'folder': folder_name,
-                            'type': 'video',
-                            'output': output_filename
-                        })
-        
-        print()
+            
+                print()
+    
+        finally:
+            # Record what the new files were written with (also when the run is interrupted)
+            if written_settings:
+                save_encode_settings(output_dir, {**recorded_settings, **written_settings})
+
+    if found == 0:
+        print("✅ No memories with overlays found!")
+        return
     
     print("🔄 Generating final report...")
     print()
@@ -459,15 +970,21 @@ def process_overlay_combining(source_dir, output_dir, dry_run=True, quality=DEFA
     print("=" * 80)
     print("📊 SUMMARY")
     print("=" * 80)
+    print(f"📊 Found {found} memories with overlays:")
+    print(f"   📷 Images: {image_count}")
+    print(f"   🎥 Videos: {video_count}")
+    print()
     
     if dry_run:
         print("⚠️  DRY RUN MODE - No files created!")
         print()
         print(f"📊 Would create:")
-        print(f"   📷 Images: {image_count}")
-        print(f"   🎥 Videos: {video_count if has_ffmpeg else 0}")
+        print(f"   📷 Images: {processed_images}")
+        print(f"   🎥 Videos: {processed_videos}")
         if skipped_videos > 0:
             print(f"   ⏭️  Skipped videos: {skipped_videos} (ffmpeg not available)")
+        if up_to_date > 0:
+            print(f"   ⏭️  Skipped existing: {up_to_date} (already up to date, use --force to recreate)")
         print()
         print("💡 To actually create the combined files, rerun with --execute flag:")
         print("   python overlay-manager.py combine --execute")
@@ -477,8 +994,14 @@ def process_overlay_combining(source_dir, output_dir, dry_run=True, quality=DEFA
         print(f"   🎥 Videos: {processed_videos}")
         if skipped_videos > 0:
             print(f"   ⏭️  Skipped videos: {skipped_videos} (ffmpeg not available)")
+        if up_to_date > 0:
+            print(f"   ⏭️  Skipped existing: {up_to_date} (already up to date, use --force to recreate)")
         if errors > 0:
             print(f"   ❌ Errors: {errors}")
+        if resized_overlays > 0:
+            print(f"   ↔️  Overlays resized to match base image: {resized_overlays}")
+        if software_fallbacks > 0:
+            print(f"   ⚠️  Videos encoded in software after {hwaccel} failed: {software_fallbacks}")
         print()
         print(f"📂 Files saved to: {output_dir}/")
         
@@ -492,6 +1015,7 @@ def process_overlay_combining(source_dir, output_dir, dry_run=True, quality=DEFA
                 print(f"\n📁 Folder: {error_info['folder']}")
                 print(f"   Type: {error_info['type']}")
                 print(f"   Output: {error_info['output']}")
+                print(f"   Error: {error_info['error']}")
 
 # ==============================================================================
 # CLI INTERFACE
@@ -529,6 +1053,11 @@ def handle_combine_command(args):
         print("❌ Quality must be between 1 and 100")
         sys.exit(1)
     
+    # Validate video parallelism
+    if args.video_parallel < 1:
+        print("❌ Video parallelism must be at least 1")
+        sys.exit(1)
+    
     print("=" * 80)
     print("Combine Snapchat Overlays")
     print("=" * 80)
@@ -559,6 +1088,22 @@ def handle_combine_command(args):
         print("   Linux: sudo apt-get install ffmpeg")
         print()
     
+    if args.fast_decode and args.quality >= FAST_DECODE_MAX_QUALITY:
+        print(f"⚠️  --fast-decode only applies with --quality below {FAST_DECODE_MAX_QUALITY} - images keep full resolution")
+        print()
+    
+    # Pick the video hardware acceleration backend
+    hwaccel = 'none'
+    if has_ffmpeg:
+        hwaccel = detect_hwaccel() if args.hwaccel == 'auto' else args.hwaccel
+        if hwaccel != 'none' and args.hwaccel != 'auto' and not hwaccel_works(hwaccel):
+            print(f"⚠️  {hwaccel} video encoding does not work with this ffmpeg/GPU - using software encoding")
+            print()
+            hwaccel = 'none'
+        if hwaccel != 'none':
+            print(f"🚀 Video hardware acceleration: {hwaccel}")
+            print()
+    
     if dry_run:
         print("⚠️  DRY RUN MODE - Preview only, no files will be created")
         print()
@@ -566,7 +1111,18 @@ def handle_combine_command(args):
         print(f"Creating combined files in: {OUTPUT_FOLDER}/")
         print()
     
-    process_overlay_combining(SOURCE_FOLDER, OUTPUT_FOLDER, dry_run=dry_run, quality=args.quality, has_ffmpeg=has_ffmpeg)
+    process_overlay_combining(
+        SOURCE_FOLDER,
+        OUTPUT_FOLDER,
+        dry_run=dry_run,
+        quality=args.quality,
+        has_ffmpeg=has_ffmpeg,
+        hwaccel=hwaccel,
+        video_preset=args.video_preset,
+        video_parallel=args.video_parallel,
+        force=args.force,
+        fast_decode=args.fast_decode
+    )
 
 def main():
     """Main entry point with subcommand parsing"""
@@ -589,6 +1145,9 @@ Examples:
   
   # Custom JPEG quality (lower values save space)
   python overlay-manager.py combine --execute --quality 90
+  
+  # Force software video encoding (no GPU)
+  python overlay-manager.py combine --execute --hwaccel none
         """
     )
     
@@ -629,6 +1188,37 @@ Examples:
         default=DEFAULT_JPEG_QUALITY,
         help=f'JPEG quality for combined images (1-100, default: {DEFAULT_JPEG_QUALITY}). Lower values (85-95) save disk space.'
     )
+    combine_parser.add_argument(
+        '--fast-decode',
+        action='store_true',
+        help=f'With --quality below {FAST_DECODE_MAX_QUALITY}, decode large images at half resolution '
+             f'(much faster; combined images are saved at half size and are recreated at full size '
+             f'by a later run without this flag)'
+    )
+    combine_parser.add_argument(
+        '--hwaccel',
+        choices=HWACCEL_CHOICES,
+        default='auto',
+        help='Hardware acceleration for videos (default: auto). Use "none" to force software encoding.'
+    )
+    combine_parser.add_argument(
+        '--video-preset',
+        choices=VIDEO_PRESETS,
+        default=DEFAULT_VIDEO_PRESET,
+        help=f'x264 preset for software video encoding (default: {DEFAULT_VIDEO_PRESET}). Slower presets give slightly smaller files.'
+    )
+    combine_parser.add_argument(
+        '--video-parallel',
+        type=int,
+        default=DEFAULT_VIDEO_PARALLEL,
+        help=f'Number of videos encoded at the same time in software mode (default: {DEFAULT_VIDEO_PARALLEL})'
+    )
+    combine_parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Recreate combined files even if they are already up to date '
+             '(files written with a different --quality, --fast-decode, --hwaccel or --video-preset are always recreated)'
+    )
     combine_parser.add_argument(
         '--skip-prompt',
         action='store_true',